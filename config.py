@@ -1,6 +1,8 @@
 import os
 import logging
-from typing import Dict, Any
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Mapping
 
 # DynamoDB Table Names
 DYNAMODB_TABLES = {
@@ -14,12 +16,25 @@ DYNAMODB_TABLES = {
 TOGETHER_AI = {
     'API_URL': 'https://api.together.xyz/v1/chat/completions',
     'API_KEY': os.environ.get('TAI_KEY', 'NULL'),  # Get from environment variable
+    'SECRET_ID': os.environ.get('TAI_SECRET_ID', ''),  # Optional Secrets Manager id, overrides API_KEY
     'MODEL': 'meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8',
     'TEMPERATURE': 0.1,
-    'MAX_TOKENS': 500,
-    'STOP_SEQUENCES': ['<|im_end|>', '<|endoftext|>']
+    'MAX_TOKENS': 300,  # four short attribute lines; bounds generation time on a runaway completion
+    'STOP_SEQUENCES': ['<|im_end|>', '<|endoftext|>'],
+    # Connection errors and RETRY_STATUSES are retried; read timeouts are not, since the
+    # generation may already have run and been billed. Worst case (MAX_RETRIES + 1) *
+    # (CONNECT_TIMEOUT + READ_TIMEOUT) is 24s (no backoff before the first retry),
+    # leaving ~6s of LAMBDA_CONFIG['TIMEOUT'] for the DB and rate-limit calls
+    'CONNECT_TIMEOUT': 2.0,  # seconds
+    'READ_TIMEOUT': 10.0,  # seconds
+    'MAX_RETRIES': 1,
+    'RETRY_BACKOFF': 0.5,  # seconds, exponential
+    'RETRY_STATUSES': [429, 500, 502, 503, 504]
 }
 
+# Shared read-only view so callers don't pay for a copy per request
+_TOGETHER_AI_VIEW = MappingProxyType(TOGETHER_AI)
+
 # LLM System Prompts
 SYSTEM_PROMPTS = {
     'THREAD_ATTRIBUTES': """You are an AI assistant that analyzes real estate conversations. Extract the following attributes from the conversation:
@@ -59,21 +74,38 @@ logging.basicConfig(
     format=LOGGING_CONFIG['FORMAT'],
     datefmt=LOGGING_CONFIG['DATE_FORMAT']
 )
-logger = logging.getLogger()
+# basicConfig is a no-op when the Lambda runtime has already attached its handler to
+# the root logger, so set the level here once; module loggers inherit it
+logging.getLogger().setLevel(LOGGING_CONFIG['LEVEL'])
 
 # Lambda Configuration
 LAMBDA_CONFIG = {
     'TIMEOUT': 30,  # seconds
-    'MEMORY_SIZE': 256  # MB
+    'MEMORY_SIZE': 256,  # MB
+    'MAX_BODY_SIZE': 4096,  # characters; a valid body only carries three ids
+    # Longer threads send the first email (original subject/context) plus the most
+    # recent MAX_EMAILS_FOR_LLM emails to bound prompt size
+    'MAX_EMAILS_FOR_LLM': 10
+}
+
+# In-process cache configuration (per warm container)
+CACHE_CONFIG = {
+    'ACCOUNT_ID_MAXSIZE': 1024,
+    'ACCOUNT_ID_TTL': 300,  # seconds
+    'THREAD_ATTRIBUTES_MAXSIZE': 512,
+    'THREAD_ATTRIBUTES_TTL': 900,  # seconds
+    'NOT_FOUND_MAXSIZE': 2048,
+    'NOT_FOUND_TTL': 60  # seconds
 }
 
+@lru_cache(maxsize=None)
 def get_table_name(table_key: str) -> str:
     """Helper function to get DynamoDB table name"""
     return DYNAMODB_TABLES.get(table_key, '')
 
-def get_together_ai_config() -> Dict[str, Any]:
-    """Helper function to get Together AI configuration"""
-    return TOGETHER_AI.copy()
+def get_together_ai_config() -> Mapping[str, Any]:
+    """Helper function to get a read-only view of the Together AI configuration"""
+    return _TOGETHER_AI_VIEW
 
 def get_system_prompt(prompt_key: str) -> str:
     """Helper function to get system prompt"""
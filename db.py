@@ -1,29 +1,88 @@
 import boto3
 import logging
+import os
+from botocore.config import Config
 import time
-import uuid
+from contextlib import contextmanager
 from typing import Dict, Any, List, Optional
-from config import get_table_name, LOGGING_CONFIG
-from utils import db_select
+from config import get_table_name, LOGGING_CONFIG, CACHE_CONFIG
+from utils import db_select, TTLCache
 
 # Set up logging
 logger = logging.getLogger(__name__)
-logger.setLevel(getattr(logging, LOGGING_CONFIG['LEVEL']))
 
-# Initialize DynamoDB resource
-dynamodb = boto3.resource('dynamodb')
+# Logging flags and table names are fixed for the container's lifetime
+_REQ_LOG = LOGGING_CONFIG['ENABLE_REQUEST_LOGGING']
+_PERF_LOG = LOGGING_CONFIG['ENABLE_PERFORMANCE_LOGGING']
+_CONVERSATIONS_TABLE_NAME = get_table_name('CONVERSATIONS')
+_THREADS_TABLE_NAME = get_table_name('THREADS')
+_INVOCATIONS_TABLE_NAME = get_table_name('INVOCATIONS')
+
+# Fields kept from each Conversations item
+_EMAIL_KEYS = ('subject', 'body', 'sender', 'timestamp', 'type')
+
+# Initialize DynamoDB resource once per container; keep-alive lets warm
+# invocations reuse pooled connections instead of paying a new TLS handshake
+DYNAMODB_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=64,
+    retries={'max_attempts': 3, 'mode': 'adaptive'}
+)
+dynamodb = boto3.resource('dynamodb', config=DYNAMODB_CONFIG)
+
+# Primary-key reads use a low-level client with pre-serialized keys, skipping the
+# resource layer's type (de)serialization. The handler always passes accountId, so only
+# direct callers that omit it reach these reads; the client is created on first use.
+_read_client = None
+
+def _get_read_client():
+    """
+    Return the primary-key read client, creating it on first use.
+    """
+    global _read_client
+    if _read_client is None:
+        _read_client = boto3.client('dynamodb', config=DYNAMODB_CONFIG)
+    return _read_client
+
+# Table handles are reused across warm invocations
+invocations_table = dynamodb.Table(_INVOCATIONS_TABLE_NAME)
+
+# conversation_id -> associated_account; the mapping never changes once a thread exists
+account_id_cache = TTLCache(
+    maxsize=CACHE_CONFIG['ACCOUNT_ID_MAXSIZE'],
+    ttl=CACHE_CONFIG['ACCOUNT_ID_TTL']
+)
+
+# Conversations recently found to have no thread; short-lived so new threads show up quickly
+not_found_cache = TTLCache(
+    maxsize=CACHE_CONFIG['NOT_FOUND_MAXSIZE'],
+    ttl=CACHE_CONFIG['NOT_FOUND_TTL']
+)
+
+@contextmanager
+def _timed(label: str):
+    """
+    Log the duration of the wrapped block when performance logging is enabled.
+    """
+    if not _PERF_LOG:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info("%s finished in %.2f seconds", label, time.perf_counter() - start)
 
 def get_email_chain(conversation_id: str, account_id: str, session_id: str) -> List[Dict[str, Any]]:
     """
     Retrieves and formats the email chain for a conversation.
     Returns a list of dictionaries with consistent 'subject' and 'body' keys.
     """
-    start_time = time.time()
-    logger.info(f"Fetching email chain for conversation: {conversation_id}")
+    logger.info("Fetching email chain for conversation: %s", conversation_id)
 
     try:
         items = db_select(
-            table_name=get_table_name('CONVERSATIONS'),
+            table_name=_CONVERSATIONS_TABLE_NAME,
             index_name='conversation_id-index',
             key_name='conversation_id',
             key_value=conversation_id,
@@ -31,29 +90,52 @@ def get_email_chain(conversation_id: str, account_id: str, session_id: str) -> L
             session_id=session_id
         )
         
-        logger.info(f"Retrieved {len(items)} items from db-select lambda.")
+        logger.info("Retrieved %s items from db-select lambda.", len(items))
         
-        # Sort by timestamp
-        sorted_items = sorted(items, key=lambda x: x.get('timestamp', ''))
+        # Sort by timestamp in place; DBSelect does not guarantee sort-key order
+        items.sort(key=lambda x: x.get('timestamp', ''))
         
         # Format items to have consistent keys
-        formatted_chain = []
-        for idx, item in enumerate(sorted_items, 1):
-            formatted_item = {
-                'subject': item.get('subject', ''),
-                'body': item.get('body', ''),
-                'sender': item.get('sender', ''),
-                'timestamp': item.get('timestamp', ''),
-                'type': item.get('type', '')
-            }
-            formatted_chain.append(formatted_item)
-        
-        return formatted_chain
+        return [{key: item.get(key, '') for key in _EMAIL_KEYS} for item in items]
         
     except Exception as e:
-        logger.error(f"Error fetching email chain: {str(e)}", exc_info=True)
+        logger.error("Error fetching email chain: %s", e, exc_info=True)
         raise Exception(f"Failed to fetch email chain for conversation {conversation_id}: {str(e)}")
 
+def _build_invocation_item(
+    associated_account: str,
+    input_tokens: int,
+    output_tokens: int,
+    llm_email_type: str,
+    model_name: str,
+    conversation_id: Optional[str] = None,
+    invocation_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Build the Invocations table item for a single LLM invocation.
+    """
+    # Create timestamp for sorting
+    timestamp = int(time.time() * 1000)
+    
+    item = {
+        'id': os.urandom(16).hex(),  # Unique identifier for the invocation
+        'associated_account': associated_account,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'llm_email_type': llm_email_type,
+        'model_name': model_name,
+        'timestamp': timestamp,
+        'total_tokens': input_tokens + output_tokens  # Convenience field for analytics
+    }
+    
+    # Add optional fields if provided
+    if conversation_id:
+        item['conversation_id'] = conversation_id
+    if invocation_id:
+        item['invocation_id'] = invocation_id
+    
+    return item
+
 def store_llm_invocation(
     associated_account: str,
     input_tokens: int,
@@ -67,133 +149,84 @@ def store_llm_invocation(
     Store an LLM invocation record in DynamoDB.
     Returns True if successful, False otherwise.
     """
-    start_time = time.time()
-    logger.info(f"Storing LLM invocation record for account: {associated_account}")
+    item = _build_invocation_item(
+        associated_account=associated_account,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        llm_email_type=llm_email_type,
+        model_name=model_name,
+        conversation_id=conversation_id,
+        invocation_id=invocation_id
+    )
     
-    if LOGGING_CONFIG['ENABLE_REQUEST_LOGGING']:
-        logger.info("Invocation details:")
-        logger.info(f"  Account: {associated_account}")
-        logger.info(f"  Type: {llm_email_type}")
-        logger.info(f"  Model: {model_name}")
-        logger.info(f"  Input tokens: {input_tokens}")
-        logger.info(f"  Output tokens: {output_tokens}")
-        logger.info(f"  Total tokens: {input_tokens + output_tokens}")
-        if conversation_id:
-            logger.info(f"  Conversation ID: {conversation_id}")
-        if invocation_id:
-            logger.info(f"  Invocation ID: {invocation_id}")
+    if _REQ_LOG and logger.isEnabledFor(logging.INFO):
+        logger.info("Writing to DynamoDB table: %s", invocations_table.name)
     
+    # One line per invocation carrying the whole record
+    record_args = (
+        item['id'], associated_account, llm_email_type, model_name,
+        input_tokens, output_tokens, conversation_id
+    )
     try:
-        invocations_table = dynamodb.Table(get_table_name('INVOCATIONS'))
-        
-        # Create timestamp for sorting
-        timestamp = int(time.time() * 1000)
-        
-        item = {
-            'id': str(uuid.uuid4()),  # Unique identifier for the invocation
-            'associated_account': associated_account,
-            'input_tokens': input_tokens,
-            'output_tokens': output_tokens,
-            'llm_email_type': llm_email_type,
-            'model_name': model_name,
-            'timestamp': timestamp,
-            'total_tokens': input_tokens + output_tokens  # Convenience field for analytics
-        }
-        
-        # Add optional fields if provided
-        if conversation_id:
-            item['conversation_id'] = conversation_id
-        if invocation_id:
-            item['invocation_id'] = invocation_id
-            
-        if LOGGING_CONFIG['ENABLE_REQUEST_LOGGING']:
-            logger.info(f"Writing to DynamoDB table: {invocations_table.name}")
-            logger.info(f"Item ID: {item['id']}")
-        
-        write_start = time.time()
-        invocations_table.put_item(Item=item)
-        write_duration = time.time() - write_start
-        
-        if LOGGING_CONFIG['ENABLE_PERFORMANCE_LOGGING']:
-            logger.info(f"DynamoDB write completed in {write_duration:.2f} seconds")
-        
-        # Success logging
-        logger.info(f"✅ Successfully stored LLM invocation record:")
-        logger.info(f"   - Record ID: {item['id']}")
-        logger.info(f"   - Account: {associated_account}")
-        logger.info(f"   - Type: {llm_email_type}")
-        logger.info(f"   - Tokens: {input_tokens + output_tokens} total")
-        if invocation_id:
-            logger.info(f"   - Invocation ID: {invocation_id}")
-        if conversation_id:
-            logger.info(f"   - Conversation ID: {conversation_id}")
-        
-        total_duration = time.time() - start_time
-        if LOGGING_CONFIG['ENABLE_PERFORMANCE_LOGGING']:
-            logger.info(f"Total invocation storage completed in {total_duration:.2f} seconds")
-        
-        return True
-        
+        with _timed("DynamoDB put"):
+            invocations_table.put_item(Item=item)
     except Exception as e:
-        logger.error(f"❌ Error storing LLM invocation record: {str(e)}", exc_info=True)
-        logger.error("Error context:")
-        logger.error(f"   - Account: {associated_account}")
-        logger.error(f"   - Type: {llm_email_type}")
-        logger.error(f"   - Model: {model_name}")
-        logger.error(f"   - Tokens: {input_tokens}/{output_tokens}")
-        logger.error(f"   - Table: {invocations_table.name}")
-        if invocation_id:
-            logger.error(f"   - Invocation ID: {invocation_id}")
-        if conversation_id:
-            logger.error(f"   - Conversation ID: {conversation_id}")
-        logger.error(f"   - Execution time: {time.time() - start_time:.2f} seconds")
+        logger.error(
+            "❌ Failed to store LLM invocation %s account=%s type=%s model=%s tokens=%s/%s conversation=%s: %s",
+            *record_args, e, exc_info=True
+        )
         return False
+    
+    logger.info(
+        "✅ Stored LLM invocation %s account=%s type=%s model=%s tokens=%s/%s conversation=%s",
+        *record_args
+    )
+    return True
 
 def get_thread_account_id(conversation_id: str) -> Optional[str]:
     """
     Get the associated account ID for a conversation from the Threads table.
     Returns None if the thread doesn't exist or there's an error.
     """
-    start_time = time.time()
-    logger.info(f"Fetching account ID for conversation: {conversation_id}")
+    logger.info("Fetching account ID for conversation: %s", conversation_id)
+
+    cached_account_id = account_id_cache.get(conversation_id)
+    if cached_account_id:
+        logger.info("Found cached account_id %s for conversation %s", cached_account_id, conversation_id)
+        return cached_account_id
+    if not_found_cache.get(conversation_id):
+        logger.info("Thread recently not found for conversation %s, skipping lookup", conversation_id)
+        return None
     
     try:
-        table = dynamodb.Table(get_table_name('THREADS'))
+        if _REQ_LOG and logger.isEnabledFor(logging.INFO):
+            logger.info("Querying DynamoDB table: %s", _THREADS_TABLE_NAME)
+            logger.info("Query parameters: conversation_id = %s", conversation_id)
         
-        if LOGGING_CONFIG['ENABLE_REQUEST_LOGGING']:
-            logger.info(f"Querying DynamoDB table: {table.name}")
-            logger.info(f"Query parameters: conversation_id = {conversation_id}")
-        
-        query_start = time.time()
-        response = table.get_item(
-            Key={'conversation_id': conversation_id}
-        )
-        query_duration = time.time() - query_start
-        
-        if LOGGING_CONFIG['ENABLE_PERFORMANCE_LOGGING']:
-            logger.info(f"DynamoDB query completed in {query_duration:.2f} seconds")
+        with _timed("DynamoDB query"):
+            response = _get_read_client().get_item(
+                TableName=_THREADS_TABLE_NAME,
+                Key={'conversation_id': {'S': conversation_id}},
+                ProjectionExpression='associated_account'
+            )
         
         if 'Item' not in response:
-            logger.warning(f"Thread not found for conversation {conversation_id}")
+            logger.warning("Thread not found for conversation %s", conversation_id)
+            not_found_cache.set(conversation_id, True)
             return None
             
-        account_id = response['Item'].get('associated_account')
+        account_id = response['Item'].get('associated_account', {}).get('S')
         if not account_id:
-            logger.warning(f"No associated_account found for conversation {conversation_id}")
+            logger.warning("No associated_account found for conversation %s", conversation_id)
             return None
             
-        logger.info(f"Found account_id {account_id} for conversation {conversation_id}")
-        
-        total_duration = time.time() - start_time
-        if LOGGING_CONFIG['ENABLE_PERFORMANCE_LOGGING']:
-            logger.info(f"Total account ID retrieval completed in {total_duration:.2f} seconds")
-            
+        logger.info("Found account_id %s for conversation %s", account_id, conversation_id)
+        account_id_cache.set(conversation_id, account_id)
         return account_id
         
     except Exception as e:
-        logger.error(f"Error getting thread account_id: {str(e)}", exc_info=True)
+        logger.error("Error getting thread account_id: %s", e, exc_info=True)
         logger.error("Error context:")
-        logger.error(f"  Conversation ID: {conversation_id}")
-        logger.error(f"  Table: {table.name}")
-        logger.error(f"  Execution time: {time.time() - start_time:.2f} seconds")
+        logger.error("  Conversation ID: %s", conversation_id)
+        logger.error("  Table: %s", _THREADS_TABLE_NAME)
         return None 
\ No newline at end of file
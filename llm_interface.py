@@ -1,18 +1,114 @@
 import json
+import os
 import urllib3
 import logging
+import threading
 import time
 import re
 from typing import Dict, Any, Optional, Tuple
 from db import store_llm_invocation
+from utils import LambdaError
 from config import get_together_ai_config, get_system_prompt, LOGGING_CONFIG
 
 # Set up logging
 logger = logging.getLogger(__name__)
-logger.setLevel(getattr(logging, LOGGING_CONFIG['LEVEL']))
 
-# Initialize urllib3 pool manager
-http = urllib3.PoolManager()
+# Logging flags are fixed for the container's lifetime
+_REQ_LOG = bool(LOGGING_CONFIG.get('ENABLE_REQUEST_LOGGING'))
+_PERF_LOG = bool(LOGGING_CONFIG.get('ENABLE_PERFORMANCE_LOGGING'))
+_RESP_LOG = bool(LOGGING_CONFIG.get('ENABLE_RESPONSE_LOGGING'))
+
+# Together AI configuration and system prompt are resolved once per container
+_TAI_CONFIG = get_together_ai_config()
+_SYSTEM_PROMPT = get_system_prompt('THREAD_ATTRIBUTES')
+
+# Initialize urllib3 pool manager with bounded timeouts and retries for transient failures.
+# raise_on_status=False hands the final failed response back to the status check below;
+# Retry-After is ignored so an upstream hint can't sleep past the Lambda timeout, and
+# read errors are never retried so a generation that already ran isn't billed twice.
+http = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=16,
+    timeout=urllib3.Timeout(connect=_TAI_CONFIG['CONNECT_TIMEOUT'], read=_TAI_CONFIG['READ_TIMEOUT']),
+    retries=urllib3.Retry(
+        total=_TAI_CONFIG['MAX_RETRIES'],
+        read=0,
+        backoff_factor=_TAI_CONFIG['RETRY_BACKOFF'],
+        status_forcelist=_TAI_CONFIG['RETRY_STATUSES'],
+        allowed_methods=frozenset({'HEAD', 'POST'}),
+        raise_on_status=False,
+        respect_retry_after_header=False
+    )
+)
+
+def _resolve_api_key() -> str:
+    """
+    Resolve the Together AI API key once per container.
+    With TAI_SECRET_ID set, the key is read from the AWS Parameters and Secrets Lambda
+    Extension's local cache; otherwise (or if that lookup fails) TAI_KEY is used.
+    """
+    secret_id = _TAI_CONFIG['SECRET_ID']
+    if not secret_id:
+        return _TAI_CONFIG['API_KEY']
+    try:
+        port = os.environ.get('PARAMETERS_SECRETS_EXTENSION_HTTP_PORT', '2773')
+        response = http.request(
+            'GET',
+            f"http://localhost:{port}/secretsmanager/get",
+            fields={'secretId': secret_id},
+            headers={'X-Aws-Parameters-Secrets-Token': os.environ.get('AWS_SESSION_TOKEN', '')},
+            retries=False
+        )
+        if response.status != 200:
+            raise Exception(f"Secrets extension returned status {response.status}")
+        return json.loads(response.data)['SecretString']
+    except Exception as e:
+        logger.error("Failed to resolve Together AI key from %s, falling back to TAI_KEY: %s", secret_id, e)
+        return _TAI_CONFIG['API_KEY']
+
+_HEADERS = {
+    "Authorization": f"Bearer {_resolve_api_key()}",
+    "Content-Type": "application/json"
+}
+
+# The request body is identical apart from the conversation text, so everything around
+# it (including the fixed user-message preamble) is serialized once here and only the
+# conversation text is JSON-escaped per call. Keep the conversation text as the last thing
+# in the prompt and keep per-request values (ids, timestamps) out of the system prompt and
+# preamble, so the static prefix stays byte-identical across requests and provider-side
+# prefix caching can reuse it
+_USER_PROMPT_PREFIX = "Please analyze this real estate conversation and provide the attributes:\n\n"
+_USER_CONTENT_MARKER = "__USER_CONTENT__"
+_PAYLOAD_HEAD, _PAYLOAD_TAIL = json.dumps({
+    "model": _TAI_CONFIG['MODEL'],
+    "messages": [
+        {
+            "role": "system",
+            "content": _SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": _USER_PROMPT_PREFIX + _USER_CONTENT_MARKER
+        }
+    ],
+    "temperature": _TAI_CONFIG['TEMPERATURE'],
+    "max_tokens": _TAI_CONFIG['MAX_TOKENS'],
+    "stop": list(_TAI_CONFIG['STOP_SEQUENCES']),
+    "stream": False
+}).encode('utf-8').split(_USER_CONTENT_MARKER.encode('utf-8'))
+
+def _prewarm_connection() -> None:
+    """
+    Open a pooled connection to the Together AI API ahead of the first request.
+    Runs on a daemon thread so DNS and the TLS handshake overlap with the DB and
+    rate-limit calls; on failure the first request simply connects itself.
+    """
+    try:
+        http.request('HEAD', _TAI_CONFIG['API_URL'], timeout=2.0, retries=False)
+    except Exception as e:
+        logger.debug("Together AI connection pre-warm failed: %s", e)
+
+threading.Thread(target=_prewarm_connection, daemon=True).start()
 
 # Define expected attributes and their validation rules
 EXPECTED_ATTRIBUTES = {
@@ -38,6 +134,9 @@ EXPECTED_ATTRIBUTES = {
     }
 }
 
+# One "key: value" pair per line, split on the first colon
+_ATTRIBUTE_LINE_RE = re.compile(r'^[ \t]*([^:\n]*?)[ \t]*:[ \t]*(.*?)[ \t\r]*$', re.MULTILINE)
+
 def to_snake_case(s: str) -> str:
     """
     Convert a string to snake_case.
@@ -93,18 +192,8 @@ def parse_llm_response(content: str) -> Dict[str, str]:
     attributes = {}
     errors = []
     
-    # Split into lines and process each line
-    lines = [line.strip() for line in content.split('\n') if line.strip()]
-    
-    for line in lines:
-        if ':' not in line:
-            logger.warning(f"Skipping invalid line (no colon): {line}")
-            continue
-            
-        key, value = line.split(':', 1)
-        key = key.strip()
-        value = value.strip()
-        
+    # Extract every "key: value" line in one pass; lines without a colon are skipped
+    for key, value in _ATTRIBUTE_LINE_RE.findall(content):
         # Normalize key to snake_case
         key_snake = to_snake_case(key)
         
@@ -114,16 +203,16 @@ def parse_llm_response(content: str) -> Dict[str, str]:
         
         if is_valid:
             attributes[key_snake] = value
-            logger.debug(f"Validated attribute - {key_snake}: {value}")
+            logger.debug("Validated attribute - %s: %s", key_snake, value)
         else:
             errors.append(f"{key_snake}: {error_msg}")
-            logger.warning(f"Invalid attribute - {key_snake}: {value} - {error_msg}")
+            logger.warning("Invalid attribute - %s: %s - %s", key_snake, value, error_msg)
     
     # Check for missing required attributes
     for key, rules in EXPECTED_ATTRIBUTES.items():
         if rules['required'] and key not in attributes:
             errors.append(f"Missing required attribute: {key}")
-            logger.warning(f"Missing required attribute: {key}")
+            logger.warning("Missing required attribute: %s", key)
     
     if errors:
         error_msg = "Validation errors:\n" + "\n".join(errors)
@@ -139,68 +228,47 @@ def get_thread_attributes(conversation_text: str, account_id: Optional[str] = No
     Returns a dictionary of validated attributes.
     """
     start_time = time.time()
-    logger.info(f"Starting thread attributes analysis for conversation_id: {conversation_id}")
+    logger.info("Starting thread attributes analysis for conversation_id: %s", conversation_id)
     
-    # Get Together AI configuration
-    tai_config = get_together_ai_config()
-    
-    headers = {
-        "Authorization": f"Bearer {tai_config['API_KEY']}",
-        "Content-Type": "application/json"
-    }
-
-    messages = [
-        {
-            "role": "system",
-            "content": get_system_prompt('THREAD_ATTRIBUTES')
-        },
-        {
-            "role": "user",
-            "content": f"Please analyze this real estate conversation and provide the attributes:\n\n{conversation_text}"
-        }
-    ]
-
-    payload = {
-        "model": tai_config['MODEL'],
-        "messages": messages,
-        "temperature": tai_config['TEMPERATURE'],
-        "max_tokens": tai_config['MAX_TOKENS'],
-        "stop": tai_config['STOP_SEQUENCES'],
-        "stream": False
-    }
-
-    if LOGGING_CONFIG['ENABLE_REQUEST_LOGGING']:
+    if _REQ_LOG and logger.isEnabledFor(logging.INFO):
         logger.info("Preparing Together AI API request:")
-        logger.info(f"  Model: {payload['model']}")
-        logger.info(f"  Temperature: {payload['temperature']}")
-        logger.info(f"  Max Tokens: {payload['max_tokens']}")
-        logger.info(f"  System Prompt: {messages[0]['content'][:100]}...")
-        logger.info(f"  User Message Length: {len(messages[1]['content'])} characters")
+        logger.info("  Model: %s", _TAI_CONFIG['MODEL'])
+        logger.info("  Temperature: %s", _TAI_CONFIG['TEMPERATURE'])
+        logger.info("  Max Tokens: %s", _TAI_CONFIG['MAX_TOKENS'])
+        logger.info("  System Prompt: %.100s...", _SYSTEM_PROMPT)
+        logger.info("  User Message Length: %s characters", len(_USER_PROMPT_PREFIX) + len(conversation_text))
 
     try:
-        encoded_data = json.dumps(payload).encode('utf-8')
+        # json.dumps escapes the text; [1:-1] drops its quotes, which the head/tail supply
+        encoded_data = b"".join((_PAYLOAD_HEAD, json.dumps(conversation_text).encode('utf-8')[1:-1], _PAYLOAD_TAIL))
         api_start_time = time.time()
         
         logger.info("Sending request to Together AI API...")
         response = http.request(
             'POST',
-            tai_config['API_URL'],
+            _TAI_CONFIG['API_URL'],
             body=encoded_data,
-            headers=headers
+            headers=_HEADERS
         )
         api_duration = time.time() - api_start_time
         
-        if LOGGING_CONFIG['ENABLE_PERFORMANCE_LOGGING']:
-            logger.info(f"API request completed in {api_duration:.2f} seconds")
+        if _PERF_LOG:
+            logger.info("API request completed in %.2f seconds", api_duration)
 
+        # Retryable statuses were already retried by the pool
+        if response.status == 429:
+            logger.error("Together AI rate limit still exceeded after retries")
+            raise LambdaError(429, "Upstream LLM rate limit exceeded.")
         if response.status != 200:
-            logger.error(f"API call failed with status {response.status}")
-            logger.error(f"Response data: {response.data.decode('utf-8')}")
-            raise Exception("Failed to fetch response from Together AI API")
+            logger.error("API call failed with status %s", response.status)
+            logger.error("Response data: %s", response.data.decode('utf-8'))
+            if response.status >= 500:
+                raise LambdaError(502, "Upstream LLM error.")
+            raise LambdaError(502, f"Upstream LLM returned HTTP {response.status}.")
 
-        response_data = json.loads(response.data.decode('utf-8'))
+        response_data = json.loads(response.data)  # json accepts UTF-8 bytes directly
         if "choices" not in response_data:
-            logger.error(f"Invalid API response structure: {json.dumps(response_data, indent=2)}")
+            logger.error("Invalid API response structure: %s", response_data)
             raise Exception("Invalid response from Together AI API")
 
         # Extract token usage
@@ -209,56 +277,56 @@ def get_thread_attributes(conversation_text: str, account_id: Optional[str] = No
         output_tokens = usage.get("completion_tokens", 0)
         total_tokens = input_tokens + output_tokens
 
-        if LOGGING_CONFIG['ENABLE_RESPONSE_LOGGING']:
+        if _RESP_LOG and logger.isEnabledFor(logging.INFO):
             logger.info("Together AI API Response Details:")
-            logger.info(f"  Status Code: {response.status}")
-            logger.info(f"  Input Tokens: {input_tokens}")
-            logger.info(f"  Output Tokens: {output_tokens}")
-            logger.info(f"  Total Tokens: {total_tokens}")
-            logger.info(f"  Response Time: {api_duration:.2f} seconds")
-            logger.info(f"  Tokens/Second: {total_tokens/api_duration:.2f}")
+            logger.info("  Status Code: %s", response.status)
+            logger.info("  Input Tokens: %s", input_tokens)
+            logger.info("  Output Tokens: %s", output_tokens)
+            logger.info("  Total Tokens: %s", total_tokens)
+            logger.info("  Response Time: %.2f seconds", api_duration)
+            logger.info("  Tokens/Second: %.2f", total_tokens/api_duration)
 
         # Store invocation record if we have an account_id
         if account_id:
-            logger.info(f"Storing LLM invocation record for account: {account_id}")
-            invocation_success = store_llm_invocation(
+            logger.info("Storing LLM invocation record for account: %s", account_id)
+            store_llm_invocation(
                 associated_account=account_id,
                 input_tokens=input_tokens,
                 output_tokens=output_tokens,
                 llm_email_type="thread_attributes",
-                model_name=payload["model"],
+                model_name=_TAI_CONFIG['MODEL'],
                 conversation_id=conversation_id
             )
-            logger.info(f"LLM invocation record storage: {'Success' if invocation_success else 'Failed'}")
 
         # Parse and validate the response
         content = response_data["choices"][0]["message"]["content"]
         try:
             attributes = parse_llm_response(content)
             
-            if LOGGING_CONFIG['ENABLE_RESPONSE_LOGGING']:
-                logger.info("Extracted and validated Thread Attributes:")
-                for key, value in attributes.items():
-                    logger.info(f"  {key}: {value}")
+            if _RESP_LOG:
+                logger.info("Extracted and validated Thread Attributes: %s", attributes)
 
             total_duration = time.time() - start_time
-            if LOGGING_CONFIG['ENABLE_PERFORMANCE_LOGGING']:
-                logger.info(f"Total thread attributes analysis completed in {total_duration:.2f} seconds")
+            if _PERF_LOG:
+                logger.info("Total thread attributes analysis completed in %.2f seconds", total_duration)
 
             return attributes
             
         except ValueError as e:
-            logger.error(f"Failed to parse LLM response: {str(e)}")
-            logger.error(f"Raw LLM response: {content}")
+            logger.error("Failed to parse LLM response: %s", e)
+            logger.error("Raw LLM response: %s", content)
             raise
 
+    except LambdaError:
+        # Upstream HTTP failures were already logged where they were raised
+        raise
     except Exception as e:
-        logger.error(f"Error in get_thread_attributes: {str(e)}", exc_info=True)
+        logger.error("Error in get_thread_attributes: %s", e, exc_info=True)
         logger.error("Error context:")
-        logger.error(f"  Conversation ID: {conversation_id}")
-        logger.error(f"  Account ID: {account_id}")
-        logger.error(f"  Model: {payload['model']}")
+        logger.error("  Conversation ID: %s", conversation_id)
+        logger.error("  Account ID: %s", account_id)
+        logger.error("  Model: %s", _TAI_CONFIG['MODEL'])
         if 'response' in locals():
-            logger.error(f"  Response Status: {response.status}")
-            logger.error(f"  Response Data: {response.data.decode('utf-8')}")
+            logger.error("  Response Status: %s", response.status)
+            logger.error("  Response Data: %s", response.data.decode('utf-8'))
         raise 
\ No newline at end of file
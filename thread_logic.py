@@ -1,10 +1,46 @@
-from config import logger
-from utils import LambdaError, format_conversation_for_llm, invoke_lambda
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from config import CACHE_CONFIG, LAMBDA_CONFIG
+from utils import LambdaError, TTLCache, format_conversation_for_llm, invoke_lambda
 from db import get_email_chain, get_thread_account_id
 from llm_interface import get_thread_attributes
-from typing import Dict, Any, List
+from typing import Dict, NamedTuple, Optional
 
-def get_attributes_for_thread(conversation_id, account_id=None, session_id=None):
+logger = logging.getLogger(__name__)
+
+# Runs the two rate-limit checks and the email chain fetch of an invocation concurrently
+_POOL = ThreadPoolExecutor(max_workers=3)
+
+_MAX_EMAILS_FOR_LLM = LAMBDA_CONFIG['MAX_EMAILS_FOR_LLM']
+
+# Exceptions can carry whole LLM responses; cap what goes into error logs
+_MAX_ERROR_LOG_CHARS = 512
+
+class ThreadAttrsResult(NamedTuple):
+    attributes: Dict[str, str]
+    account_id: str
+    email_count: int
+
+# (account_id, conversation_id, conversation text digest) -> attributes; any change to the
+# text sent to the LLM changes the key, so only identical prompts reuse a result
+thread_attributes_cache = TTLCache(
+    maxsize=CACHE_CONFIG['THREAD_ATTRIBUTES_MAXSIZE'],
+    ttl=CACHE_CONFIG['THREAD_ATTRIBUTES_TTL']
+)
+
+# (account_id, conversation_id) recently found to have no emails; repeat polls get their
+# 404 without invoking the rate limiters or DBSelect
+empty_chain_cache = TTLCache(
+    maxsize=CACHE_CONFIG['NOT_FOUND_MAXSIZE'],
+    ttl=CACHE_CONFIG['NOT_FOUND_TTL']
+)
+
+def get_attributes_for_thread(
+    conversation_id: str,
+    account_id: Optional[str] = None,
+    session_id: Optional[str] = None
+) -> ThreadAttrsResult:
     """
     Retrieves and processes thread attributes for a given conversation ID.
     """
@@ -16,15 +52,40 @@ def get_attributes_for_thread(conversation_id, account_id=None, session_id=None)
     if not session_id:
         session_id = "dummy_session_id" # This should be replaced with a real session ID
 
-    # Check AWS and AI rate limits by invoking the respective lambdas
-    invoke_lambda('RateLimitAWS', {'client_id': account_id, 'session': session_id})
-    invoke_lambda('RateLimitAI', {'client_id': account_id, 'session': session_id})
+    chain_key = (account_id, conversation_id)
+    if empty_chain_cache.get(chain_key):
+        raise LambdaError(404, "No conversation found with the given ID.")
+
+    # Check AWS and AI rate limits by invoking the respective lambdas, overlapping
+    # both checks with the email chain fetch since none depends on the others. This saves
+    # a serial round trip, but a throttled request still pays for its DBSelect call
+    rate_limit_payload = {'client_id': account_id, 'session': session_id}
+    rate_limit_checks = [
+        _POOL.submit(invoke_lambda, 'RateLimitAWS', rate_limit_payload),
+        _POOL.submit(invoke_lambda, 'RateLimitAI', rate_limit_payload)
+    ]
+    email_chain_fetch = _POOL.submit(get_email_chain, conversation_id, account_id, session_id)
+    for check in rate_limit_checks:
+        check.result()  # re-raises LambdaError (e.g. 429) from the rate limiter
 
-    email_chain = get_email_chain(conversation_id, account_id, session_id)
+    email_chain = email_chain_fetch.result()
     if not email_chain:
+        empty_chain_cache.set(chain_key, True)
         raise LambdaError(404, "No conversation found with the given ID.")
-    
-    conversation_text = format_conversation_for_llm(email_chain)
+    email_count = len(email_chain)
+
+    # Keep the first email for context and the latest ones for the current state
+    llm_chain = email_chain
+    if email_count > _MAX_EMAILS_FOR_LLM + 1:
+        llm_chain = email_chain[:1] + email_chain[-_MAX_EMAILS_FOR_LLM:]
+    conversation_text = format_conversation_for_llm(llm_chain)
+
+    conversation_digest = hashlib.blake2b(conversation_text.encode('utf-8'), digest_size=16).digest()
+    cache_key = (account_id, conversation_id, conversation_digest)
+    cached_attributes = thread_attributes_cache.get(cache_key)
+    if cached_attributes is not None:
+        logger.info("Using cached thread attributes for %s", conversation_id)
+        return ThreadAttrsResult(cached_attributes, account_id, email_count)
     
     try:
         attributes = get_thread_attributes(
@@ -32,11 +93,18 @@ def get_attributes_for_thread(conversation_id, account_id=None, session_id=None)
             account_id=account_id,
             conversation_id=conversation_id
         )
-        return attributes, account_id, len(email_chain)
+        thread_attributes_cache.set(cache_key, attributes)
+        return ThreadAttrsResult(attributes, account_id, email_count)
         
+    except LambdaError:
+        raise
     except ValueError as e:
-        logger.error(f"LLM validation error for {conversation_id}: {e}")
+        error = str(e)[:_MAX_ERROR_LOG_CHARS]
+        logger.error("LLM validation error for %s: %s", conversation_id, error,
+                     extra={'conversation_id': conversation_id, 'error': error})
         raise LambdaError(422, str(e))
     except Exception as e:
-        logger.error(f"Error getting thread attributes for {conversation_id}: {e}")
+        error = str(e)[:_MAX_ERROR_LOG_CHARS]
+        logger.error("Error getting thread attributes for %s: %s", conversation_id, error,
+                     extra={'conversation_id': conversation_id, 'error': error})
         raise LambdaError(500, "Failed to get thread attributes from LLM.")
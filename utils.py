@@ -1,13 +1,31 @@
+import io
 import json
+import logging
+import time
 import boto3
+from collections import OrderedDict
 from typing import Dict, Any, List
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from config import logger, AWS_REGION
+from config import AWS_REGION
 
-lambda_client = boto3.client("lambda", region_name=AWS_REGION)
+logger = logging.getLogger(__name__)
+
+# Shared across warm invocations; the pool is sized for the parallel rate-limit and DBSelect calls
+lambda_client = boto3.client(
+    "lambda",
+    region_name=AWS_REGION,
+    config=Config(
+        tcp_keepalive=True,
+        max_pool_connections=16,
+        connect_timeout=2,
+        read_timeout=20,
+        retries={'max_attempts': 2, 'mode': 'standard'}
+    )
+)
 
 class LambdaError(Exception):
-    def __init__(self, status_code, message):
+    def __init__(self, status_code: int, message: str):
         self.status_code = status_code
         self.message = message
         super().__init__(f"[{status_code}] {message}")
@@ -15,19 +33,48 @@ class LambdaError(Exception):
 class AuthorizationError(Exception):
     pass
 
-def create_response(status_code, body):
+class TTLCache:
+    """
+    Small in-process cache for warm Lambda containers.
+    Entries expire after `ttl` seconds; the least recently used entry is evicted once
+    `maxsize` is reached, so hot keys stay cached through bursts of other traffic.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        if key in self._data:
+            self._data.move_to_end(key)
+        elif len(self._data) >= self.maxsize:
+            self._data.popitem(last=False)
+        self._data[key] = (value, time.monotonic() + self.ttl)
+
+def create_response(status_code: int, body: Any) -> Dict[str, Any]:
     return {
         "statusCode": status_code,
         "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-        "body": json.dumps(body),
+        "body": json.dumps(body, separators=(',', ':')),
     }
 
-def invoke_lambda(function_name, payload, invocation_type="RequestResponse"):
+def invoke_lambda(function_name: str, payload: Dict[str, Any], invocation_type: str = "RequestResponse") -> Dict[str, Any]:
     try:
         response = lambda_client.invoke(
             FunctionName=function_name,
             InvocationType=invocation_type,
-            Payload=json.dumps(payload),
+            Payload=json.dumps(payload, separators=(',', ':')).encode('utf-8'),
         )
         response_payload_bytes = response["Payload"].read()
         if not response_payload_bytes:
@@ -76,11 +123,11 @@ def invoke_lambda(function_name, payload, invocation_type="RequestResponse"):
         logger.error(f"An unexpected error occurred invoking {function_name}: {e}", exc_info=True)
         raise LambdaError(500, f"An unexpected error occurred invoking {function_name}: {e}")
 
-def parse_event(event):
+def parse_event(event: Dict[str, Any]) -> Dict[str, Any]:
     response = invoke_lambda('ParseEvent', event)
     return json.loads(response.get('body', '{}'))
 
-def authorize(user_id, session_id):
+def authorize(user_id: str, session_id: str) -> None:
     payload = {'user_id': user_id, 'session_id': session_id}
     try:
         response = invoke_lambda('Authorize', payload)
@@ -90,38 +137,49 @@ def authorize(user_id, session_id):
     except LambdaError as e:
         raise AuthorizationError(e.message) from e
 
-def db_select(table_name, index_name, key_name, key_value, account_id, session_id):
+def db_select(table_name: str, index_name: str, key_name: str, key_value: str, account_id: str, session_id: str) -> List[Dict[str, Any]]:
     payload = {
         'table_name': table_name, 'index_name': index_name,
         'key_name': key_name, 'key_value': key_value,
         'account_id': account_id, 'session_id': session_id
     }
-    response = invoke_lambda('DBSelect', {'body': json.dumps(payload)})
+    response = invoke_lambda('DBSelect', {'body': json.dumps(payload, separators=(',', ':'))})
     return json.loads(response.get('body', '[]'))
 
-def db_update(table_name, key_name, key_value, index_name, update_data, account_id, session_id):
+def db_update(table_name: str, key_name: str, key_value: str, index_name: str, update_data: Dict[str, Any], account_id: str, session_id: str) -> Dict[str, Any]:
     payload = {
         'table_name': table_name, 'key_name': key_name, 'key_value': key_value,
         'index_name': index_name, 'update_data': update_data,
         'account_id': account_id, 'session_id': session_id
     }
-    response = invoke_lambda('DBUpdate', {'body': json.dumps(payload)})
+    response = invoke_lambda('DBUpdate', {'body': json.dumps(payload, separators=(',', ':'))})
     return json.loads(response.get('body', '{}'))
 
-def db_delete(table_name, key_name, key_value, index_name, account_id, session_id):
+def db_delete(table_name: str, key_name: str, key_value: str, index_name: str, account_id: str, session_id: str) -> Dict[str, Any]:
     payload = {
         'table_name': table_name, 'key_name': key_name, 'key_value': key_value,
         'index_name': index_name, 'account_id': account_id, 'session_id': session_id
     }
-    response = invoke_lambda('DBDelete', {'body': json.dumps(payload)})
+    response = invoke_lambda('DBDelete', {'body': json.dumps(payload, separators=(',', ':'))})
     return json.loads(response.get('body', '{}'))
 
 def format_conversation_for_llm(email_chain: List[Dict[str, Any]]) -> str:
     """
     Formats the email chain into a single string for LLM processing.
+    Only email content goes in here; it becomes the dynamic tail of the prompt.
+    Expects records normalized by db.get_email_chain (every key present).
     """
-    formatted_text = ""
+    # Single-email threads are common; one f-string beats setting up a buffer
+    if len(email_chain) == 1:
+        email = email_chain[0]
+        return f"Subject: {email['subject']}\nBody: {email['body']}\n\n"
+
+    buffer = io.StringIO()
+    write = buffer.write
     for email in email_chain:
-        formatted_text += f"Subject: {email.get('subject', '')}\n"
-        formatted_text += f"Body: {email.get('body', '')}\n\n"
-    return formatted_text 
\ No newline at end of file
+        write("Subject: ")
+        write(str(email['subject']))
+        write("\nBody: ")
+        write(str(email['body']))
+        write("\n\n")
+    return buffer.getvalue() 
\ No newline at end of file